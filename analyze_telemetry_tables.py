@@ -4,137 +4,231 @@ Analyze graphics and statics tables in telemetry database.
 Generates documentation showing field variability and useful info.
 """
 
+import math
 import sqlite3
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from heapq import merge
 from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, List, Tuple, Any
 
-def analyze_field_variability(cursor, table: str, field: str, field_type: str) -> Tuple[str, str]:
+# Interned so the row builder and the summary counters compare by pointer
+_YES = sys.intern('yes')
+_NO = sys.intern('no')
+
+# Separator for the text-sample GROUP_CONCAT: the ASCII unit separator,
+# which won't appear in telemetry strings.
+SAMPLE_SEP = '\x1f'
+
+def build_field_aggregates(table: str, field: str, field_type: str) -> List[str]:
+    """
+    Build the five expressions computed for a field in the fused per-table
+    scan: non-null count, distinct count, min, max, and (text only) up to
+    five distinct sample values. Zeros (numeric) and empty strings (text)
+    are excluded from min/max/distinct, matching the per-field queries this
+    replaces.
     """
-    Analyze a field for variability and range.
+    if field_type in ['INTEGER', 'REAL']:
+        # The numeric branch only ever asks "more than one distinct value?",
+        # so probe for a value differing from the first non-null one instead
+        # of paying COUNT(DISTINCT)'s full sort tree: the probe exits on the
+        # first mismatch and only scans to the end for constant columns.
+        return [
+            f"COUNT({field})",
+            f"EXISTS (SELECT 1 FROM {table} WHERE {field} IS NOT NULL AND {field} !="
+            f" (SELECT {field} FROM {table} WHERE {field} IS NOT NULL LIMIT 1))",
+            f"MIN(NULLIF({field}, 0))",
+            f"MAX(NULLIF({field}, 0))",
+            "NULL",
+        ]
+    else:  # TEXT fields
+        return [
+            f"COUNT({field})",
+            f"COUNT(DISTINCT NULLIF({field}, ''))",
+            f"MIN(NULLIF({field}, ''))",
+            f"MAX(NULLIF({field}, ''))",
+            f"(SELECT GROUP_CONCAT(v, CHAR(31)) FROM"
+            f" (SELECT DISTINCT {field} AS v FROM {table}"
+            f" WHERE {field} IS NOT NULL AND {field} != '' LIMIT 5))",
+        ]
+
+def analyze_field_variability(field: str, field_type: str,
+                              stats: Tuple[Any, ...]) -> Tuple[str, str]:
+    """
+    Analyze a field for variability and range from its precomputed
+    (non_null_count, distinct_count, min_val, max_val, samples) aggregates.
+    For numeric fields distinct_count is the 0/1 "has a second distinct
+    value" probe result rather than an exact count.
     Returns (variability_status, range_description)
     """
-    # Check if field has any non-null values
-    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {field} IS NOT NULL")
-    non_null_count = cursor.fetchone()[0]
-    
+    non_null_count, distinct_count, min_val, max_val, sample_blob = stats
+
     if non_null_count == 0:
-        return ("no", "no data")
-    
+        return (_NO, "no data")
+
     if field_type in ['INTEGER', 'REAL']:
-        # For numeric fields, check min/max (excluding zeros as per physics convention)
-        cursor.execute(f"""
-            SELECT 
-                MIN(CASE WHEN {field} != 0 THEN {field} END) as min_val,
-                MAX(CASE WHEN {field} != 0 THEN {field} END) as max_val,
-                COUNT(DISTINCT {field}) as distinct_count,
-                COUNT(*) as total_count
-            FROM {table}
-            WHERE {field} IS NOT NULL
-        """)
-        min_val, max_val, distinct_count, total_count = cursor.fetchone()
-        
         if min_val is None and max_val is None:
             # All values are 0 or NULL
-            return ("no", "constant 0 (no data)")
-        
-        if distinct_count == 1:
-            return ("no", f"constant {min_val}")
-        
+            return (_NO, "constant 0 (no data)")
+
+        if not distinct_count:
+            # Probe found no second distinct value
+            return (_NO, f"constant {min_val}")
+
         # Format range nicely
         if field_type == 'INTEGER':
             range_str = f"{int(min_val) if min_val else 0} … {int(max_val) if max_val else 0}"
         else:
-            # For floats, use appropriate precision
-            if abs(max_val - min_val) < 0.01:
-                range_str = f"~{min_val:.6f} … {max_val:.6f}"
-            elif abs(max_val - min_val) < 1:
-                range_str = f"~{min_val:.4f} … {max_val:.4f}"
-            else:
-                range_str = f"~{min_val:.2f} … {max_val:.2f}"
-        
-        return ("yes", range_str)
-    
+            # For floats, pick the precision from the span's magnitude in
+            # one shot: 6 decimals below 0.01, 4 below 1, 2 otherwise -
+            # the same thresholds as the old comparison chain, branchless.
+            span = abs(max_val - min_val)
+            exp = math.floor(math.log10(max(span, 1e-12)))
+            prec = min(6, max(2, 2 * math.ceil((2 - exp) / 2)))
+            range_str = f"~{min_val:.{prec}f} … {max_val:.{prec}f}"
+
+        return (_YES, range_str)
+
     else:  # TEXT fields
-        cursor.execute(f"""
-            SELECT 
-                COUNT(DISTINCT {field}) as distinct_count,
-                COUNT(*) as total_count
-            FROM {table}
-            WHERE {field} IS NOT NULL AND {field} != ''
-        """)
-        distinct_count, total_count = cursor.fetchone()
-        
         if distinct_count == 0:
-            return ("no", "empty/null")
-        
+            return (_NO, "empty/null")
+
         if distinct_count == 1:
-            cursor.execute(f"SELECT {field} FROM {table} WHERE {field} IS NOT NULL AND {field} != '' LIMIT 1")
-            value = cursor.fetchone()[0]
-            return ("no", f'constant "{value}"')
-        
-        # Get sample values
-        cursor.execute(f"SELECT DISTINCT {field} FROM {table} WHERE {field} IS NOT NULL AND {field} != '' LIMIT 5")
-        samples = [row[0] for row in cursor.fetchall()]
+            # The single distinct non-empty value is the min
+            return (_NO, f'constant "{min_val}"')
+
+        # Sample values were gathered in the same scan
+        samples = sample_blob.split(SAMPLE_SEP)
         if len(samples) <= 3:
-            return ("yes", f"values: {', '.join(repr(s) for s in samples)}")
+            return (_YES, f"values: {', '.join(repr(s) for s in samples)}")
         else:
-            return ("yes", f"{distinct_count} distinct values (e.g., {', '.join(repr(s) for s in samples[:3])}, ...)")
+            return (_YES, f"{distinct_count} distinct values (e.g., {', '.join(repr(s) for s in samples[:3])}, ...)")
+
+def collect_field_stats(cursor, table: str,
+                        fields: List[Tuple[str, str]]) -> Tuple[int, Dict[str, Tuple[Any, ...]]]:
+    """
+    Compute the table row count plus (non_null_count, distinct_count,
+    min_val, max_val, samples) for every field in one scan of the table.
+    The reductions run vectorized inside SQLite's C aggregates, so the
+    per-row work never touches Python.
+    """
+    select_list = ["COUNT(*)"]
+    for field_name, field_type in fields:
+        select_list.extend(build_field_aggregates(table, field_name, field_type))
+    cursor.execute(f"SELECT {', '.join(select_list)} FROM {table}")
+    row = cursor.fetchone()
+
+    return row[0], {field_name: row[1 + i * 5:1 + i * 5 + 5]
+                    for i, (field_name, _) in enumerate(fields)}
+
+# Schema memo: one PRAGMA table_info per (database, table) per process,
+# shared across the parallel per-table connections. Plain dict ops are
+# atomic under the GIL, so no locking is needed for the two workers.
+_SCHEMA_CACHE: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+
+def get_table_schema(cursor, db_path: Path, table: str) -> List[Tuple[str, str]]:
+    """Get list of (column_name, type) for a table, memoized per database."""
+    key = (str(db_path), table)
+    schema = _SCHEMA_CACHE.get(key)
+    if schema is None:
+        cursor.execute(f"PRAGMA table_info({table})")
+        schema = _SCHEMA_CACHE[key] = [(row[1], row[2]) for row in cursor.fetchall()]
+    return schema
 
-def get_table_schema(cursor, table: str) -> List[Tuple[str, str]]:
-    """Get list of (column_name, type) for a table."""
-    cursor.execute(f"PRAGMA table_info({table})")
-    return [(row[1], row[2]) for row in cursor.fetchall()]
+def open_analysis_connection(db_path: Path) -> sqlite3.Connection:
+    """Open a connection tuned for the read-only, scan-heavy analysis."""
+    # mode=ro skips journal preparation and lock escalation entirely, and
+    # cache=shared lets the parallel graphics/statics connections co-use
+    # one page cache. Each worker thread opens (and closes) its own
+    # connection; isolation_level=None so the PRAGMAs below take effect
+    # immediately. cached_statements: keep every statement of a run
+    # prepared, so repeated SQL texts skip SQLite's parser and planner.
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro&cache=shared", uri=True,
+                           isolation_level=None, check_same_thread=False,
+                           cached_statements=1024)
+    cursor = conn.cursor()
+
+    # Big page cache + mmap keep the tables hot across the aggregate scans
+    # instead of re-faulting pages from disk.
+    cursor.execute("PRAGMA cache_size=-262144")  # 256 MB
+    cursor.execute("PRAGMA mmap_size=4294967296")  # 4 GB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA query_only=1")
+    return conn
 
 def analyze_table(db_path: Path, table: str) -> Dict[str, Dict[str, Any]]:
-    """Analyze all fields in a table."""
-    conn = sqlite3.connect(db_path)
+    """Analyze all fields in a table on this call's own connection."""
+    conn = open_analysis_connection(db_path)
     cursor = conn.cursor()
-    
-    # Check if table exists and has data
-    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-    row_count = cursor.fetchone()[0]
-    
+
+    schema = get_table_schema(cursor, db_path, table)
+
+    # PRAGMA table_info returns nothing for a missing table
+    if not schema:
+        print(f"Warning: {table} table is missing", file=sys.stderr)
+        conn.close()
+        return {}
+
+    # Skip metadata fields, plus BLOB/untyped columns - neither the numeric
+    # nor the text aggregates mean anything for those.
+    skip_fields = {'recording_id', 'time_offset', 'packet_id', 'id'}
+    fields = [(name, ftype) for name, ftype in schema
+              if name not in skip_fields and ftype in ('INTEGER', 'REAL', 'TEXT')]
+
+    # Numeric columns first: their aggregates are the cheap ones, and
+    # grouping them lets SQLite's row decoder walk a contiguous run of the
+    # record layout. Display order is restored by the formatter's sort.
+    fields.sort(key=lambda f: 0 if f[1] in ('INTEGER', 'REAL') else 1)
+
+    # The row count rides along in the same scan as the field stats, so
+    # the emptiness check no longer costs its own pass over the table.
+    row_count, stats_by_field = collect_field_stats(cursor, table, fields)
+
     if row_count == 0:
         print(f"Warning: {table} table is empty", file=sys.stderr)
+        conn.close()
         return {}
-    
-    schema = get_table_schema(cursor, table)
+
     results = {}
-    
-    # Skip metadata fields
-    skip_fields = {'recording_id', 'time_offset', 'packet_id', 'id'}
-    
-    for field_name, field_type in schema:
-        if field_name in skip_fields:
-            continue
-        
-        variability, range_info = analyze_field_variability(cursor, table, field_name, field_type)
+    for field_name, field_type in fields:
+        variability, range_info = analyze_field_variability(
+            field_name, field_type, stats_by_field[field_name])
         results[field_name] = {
             'type': field_type,
             'variable': variability,
             'range': range_info
         }
-    
+
     conn.close()
     return results
 
-def format_markdown_table(table_name: str, results: Dict[str, Dict[str, Any]], descriptions: Dict[str, str]) -> str:
-    """Format results as markdown table."""
+# Row template parsed once; format_map reuses it for every row.
+_ROW_TMPL = "| `{field}` | {desc} | {var} | {range} |".format_map
+
+def format_markdown_table(table_name: str, results: Dict[str, Dict[str, Any]],
+                          descriptions: Dict[str, str],
+                          description_order: Tuple[Tuple[str, str], ...]) -> List[str]:
+    """Format results as a list of markdown table lines."""
     output = [f"## {table_name.title()} Fields\n"]
     output.append("| Field | Description | Variable | Range |")
     output.append("|-------|-------------|----------|-------|")
-    
-    for field, info in sorted(results.items()):
-        desc = descriptions.get(field, "")
-        var = info['variable']
-        range_info = info['range']
-        output.append(f"| `{field}` | {desc} | {var} | {range_info} |")
-    
-    return "\n".join(output)
 
-# Field descriptions based on schema and AC documentation
-GRAPHICS_DESCRIPTIONS = {
+    # Row order comes from the sorted tuple precomputed at import time;
+    # fields without a description entry are merged in, still sorted.
+    extras = sorted((field, "") for field in results if field not in descriptions)
+    for field, desc in merge(description_order, extras):
+        info = results.get(field)
+        if info is None:
+            continue
+        output.append(_ROW_TMPL({'field': field, 'desc': desc,
+                                 'var': info['variable'], 'range': info['range']}))
+
+    return output
+
+# Field descriptions based on schema and AC documentation.
+# Frozen via MappingProxyType; row order is precomputed once below.
+GRAPHICS_DESCRIPTIONS = MappingProxyType({
     'status': 'Session status (0=off, 1=replay, 2=live, 3=pause)',
     'session_type': 'Session type (0=unknown, 1=practice, 2=qualify, 3=race, etc.)',
     'session_index': 'Current session index',
@@ -219,9 +313,9 @@ GRAPHICS_DESCRIPTIONS = {
     'mfd_tyre_pressure_rr': 'MFD target tyre pressure RR (psi)',
     'current_tyre_set': 'Current tyre set',
     'strategy_tyre_set': 'Strategy tyre set',
-}
+})
 
-STATICS_DESCRIPTIONS = {
+STATICS_DESCRIPTIONS = MappingProxyType({
     'sm_version': 'Shared memory version',
     'ac_version': 'Assetto Corsa version',
     'number_of_sessions': 'Number of sessions',
@@ -245,7 +339,10 @@ STATICS_DESCRIPTIONS = {
     'is_online': 'Online session',
     'dry_tyres_name': 'Dry tyres name',
     'wet_tyres_name': 'Wet tyres name',
-}
+})
+
+_GRAPHICS_SORTED = tuple(sorted(GRAPHICS_DESCRIPTIONS.items()))
+_STATICS_SORTED = tuple(sorted(STATICS_DESCRIPTIONS.items()))
 
 def main():
     if len(sys.argv) < 2:
@@ -259,42 +356,47 @@ def main():
     
     print(f"Analyzing {db_path}...\n", file=sys.stderr)
     
-    # Analyze graphics table
-    print("Analyzing graphics table...", file=sys.stderr)
-    graphics_results = analyze_table(db_path, 'graphics')
-    
-    # Analyze statics table
-    print("Analyzing statics table...", file=sys.stderr)
-    statics_results = analyze_table(db_path, 'statics')
-    
-    # Generate markdown output
-    print("\n# Graphics and Statics Fields Analysis\n")
-    print("Analysis of graphics and statics tables showing field variability and ranges.")
-    print("Data source:", db_path.name)
-    print("\n**Variability:** Fields marked 'yes' contain varying data. Fields marked 'no' are constant or contain no useful data.")
-    print("**Range:** Shows the range of values (for numeric fields) or sample values (for text fields).")
-    print("**Note:** Zeros are excluded from min/max calculations (assumption: 0 = no data).\n")
-    print("---\n")
-    
+    # The two tables are independent; scan them in parallel. SQLite drops
+    # the GIL during the C-level scans, so the threads genuinely overlap.
+    print("Analyzing graphics and statics tables...", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        graphics_future = executor.submit(analyze_table, db_path, 'graphics')
+        statics_future = executor.submit(analyze_table, db_path, 'statics')
+        graphics_results = graphics_future.result()
+        statics_results = statics_future.result()
+
+    # Generate markdown output: collect every line and emit with one write
+    # instead of a syscall per print.
+    out: List[str] = []
+    out.append("\n# Graphics and Statics Fields Analysis\n")
+    out.append("Analysis of graphics and statics tables showing field variability and ranges.")
+    out.append(f"Data source: {db_path.name}")
+    out.append("\n**Variability:** Fields marked 'yes' contain varying data. Fields marked 'no' are constant or contain no useful data.")
+    out.append("**Range:** Shows the range of values (for numeric fields) or sample values (for text fields).")
+    out.append("**Note:** Zeros are excluded from min/max calculations (assumption: 0 = no data).\n")
+    out.append("---\n")
+
     if graphics_results:
-        print(format_markdown_table("Graphics", graphics_results, GRAPHICS_DESCRIPTIONS))
-        print("\n---\n")
-    
+        out.extend(format_markdown_table("Graphics", graphics_results, GRAPHICS_DESCRIPTIONS, _GRAPHICS_SORTED))
+        out.append("\n---\n")
+
     if statics_results:
-        print(format_markdown_table("Statics", statics_results, STATICS_DESCRIPTIONS))
-        print("\n---\n")
-    
-    print("\n## Summary\n")
-    
+        out.extend(format_markdown_table("Statics", statics_results, STATICS_DESCRIPTIONS, _STATICS_SORTED))
+        out.append("\n---\n")
+
+    out.append("\n## Summary\n")
+
     if graphics_results:
-        variable_count = sum(1 for info in graphics_results.values() if info['variable'] == 'yes')
+        variable_count = sum(1 for info in graphics_results.values() if info['variable'] is _YES)
         total_count = len(graphics_results)
-        print(f"**Graphics:** {variable_count}/{total_count} fields have variable data")
-    
+        out.append(f"**Graphics:** {variable_count}/{total_count} fields have variable data")
+
     if statics_results:
-        variable_count = sum(1 for info in statics_results.values() if info['variable'] == 'yes')
+        variable_count = sum(1 for info in statics_results.values() if info['variable'] is _YES)
         total_count = len(statics_results)
-        print(f"**Statics:** {variable_count}/{total_count} fields have variable data")
+        out.append(f"**Statics:** {variable_count}/{total_count} fields have variable data")
+
+    sys.stdout.write("\n".join(out) + "\n")
 
 if __name__ == '__main__':
     main()